@@ -5,18 +5,23 @@ A production-grade document Q&A system using LangChain and Gemini
 
 import streamlit as st
 import os
+import shutil
+import tempfile
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from config import (
     APP_TITLE, 
     APP_DESCRIPTION, 
     GOOGLE_API_KEY,
     SUPPORTED_FORMATS,
-    MAX_FILE_SIZE_MB
+    MAX_FILE_SIZE_MB,
+    MAX_UPLOAD_WORKERS
 )
 from utils.document_processor import DocumentProcessor
 from utils.vector_store import VectorStoreManager
 from utils.qa_chain import QAChainManager
+from utils.semantic_cache import SemanticCache
 
 
 # Page configuration
@@ -68,6 +73,25 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# Shared resources: built once per server process and reused by every session
+@st.cache_resource(show_spinner=False)
+def get_doc_processor() -> DocumentProcessor:
+    """Get the shared document processor"""
+    return DocumentProcessor()
+
+
+@st.cache_resource(show_spinner=False)
+def get_vector_store_manager() -> VectorStoreManager:
+    """Get the shared vector store manager (loads the embedding model once)"""
+    return VectorStoreManager()
+
+
+@st.cache_resource(show_spinner=False)
+def get_qa_manager(api_key: str) -> QAChainManager:
+    """Get the shared QA manager for an API key"""
+    return QAChainManager(api_key)
+
+
 # Initialize session state
 def initialize_session_state():
     """Initialize all session state variables"""
@@ -78,11 +102,14 @@ def initialize_session_state():
         st.session_state.qa_manager = None
     
     if 'doc_processor' not in st.session_state:
-        st.session_state.doc_processor = DocumentProcessor()
+        st.session_state.doc_processor = get_doc_processor()
     
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
     
+    if 'semantic_cache' not in st.session_state:
+        st.session_state.semantic_cache = SemanticCache()
+    
     if 'api_key_validated' not in st.session_state:
         st.session_state.api_key_validated = False
 
@@ -92,11 +119,11 @@ def initialize_managers(api_key: str):
     try:
         if st.session_state.vector_store_manager is None:
             with st.spinner("Initializing vector store..."):
-                st.session_state.vector_store_manager = VectorStoreManager()
+                st.session_state.vector_store_manager = get_vector_store_manager()
         
         if st.session_state.qa_manager is None:
             with st.spinner("Initializing AI system..."):
-                st.session_state.qa_manager = QAChainManager(api_key)
+                st.session_state.qa_manager = get_qa_manager(api_key)
         
         st.session_state.api_key_validated = True
         return True
@@ -114,39 +141,97 @@ def handle_file_upload(uploaded_files):
     success_count = 0
     error_count = 0
     
+    # Chunks are stored under ids derived from the file name, so only the
+    # last of several files sharing a name is indexed
+    files_by_name = {}
+    for uploaded_file in uploaded_files:
+        if uploaded_file.name in files_by_name:
+            st.warning(f"⚠️ {uploaded_file.name}: uploaded more than once, using the last copy")
+        files_by_name[uploaded_file.name] = uploaded_file
+    uploaded_files = list(files_by_name.values())
+    
     progress_bar = st.progress(0)
     status_text = st.empty()
     
-    for idx, uploaded_file in enumerate(uploaded_files):
+    # Worker threads have no Streamlit script context, so grab the managers
+    # up front and keep all st.* calls on this thread
+    doc_processor = st.session_state.doc_processor
+    vector_store_manager = st.session_state.vector_store_manager
+    
+    def process_file(uploaded_file):
+        # Spool the upload to disk so parsers read from the file rather than
+        # a second in-memory copy; parsing runs mostly in native code, so
+        # files can overlap in threads
+        suffix = os.path.splitext(uploaded_file.name)[1]
+        tmp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+        tmp_path = tmp.name
         try:
-            status_text.text(f"Processing {uploaded_file.name}...")
+            # Inside the try, so a failed copy (e.g. disk full) still
+            # removes the partial file
+            with tmp:
+                shutil.copyfileobj(uploaded_file, tmp, length=1 << 20)
             
-            # Read file bytes
-            file_bytes = uploaded_file.read()
+            # Identical content that is already indexed needs no work at all
+            content_hash = doc_processor.compute_content_hash(tmp_path)
+            if vector_store_manager.has_hash(content_hash):
+                return content_hash, None, None
             
-            # Process document
-            documents = st.session_state.doc_processor.process_document(
+            documents, document_meta = doc_processor.process_document_path(
                 uploaded_file.name, 
-                file_bytes
+                tmp_path, 
+                content_hash=content_hash
             )
+            return content_hash, documents, document_meta
+        finally:
+            os.remove(tmp_path)
+    
+    status_text.text(f"Processing {len(uploaded_files)} file(s)...")
+    
+    processed = []
+    seen_hashes = set()
+    with ThreadPoolExecutor(max_workers=min(MAX_UPLOAD_WORKERS, len(uploaded_files))) as executor:
+        futures = {
+            executor.submit(process_file, uploaded_file): uploaded_file
+            for uploaded_file in uploaded_files
+        }
+        
+        for idx, future in enumerate(as_completed(futures)):
+            uploaded_file = futures[future]
+            try:
+                content_hash, documents, document_meta = future.result()
+                if documents is None or content_hash in seen_hashes:
+                    st.success(f"✅ {uploaded_file.name}: already indexed")
+                    success_count += 1
+                else:
+                    seen_hashes.add(content_hash)
+                    processed.append((uploaded_file.name, documents, document_meta))
+            except Exception as e:
+                st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
+                error_count += 1
             
-            # Add to vector store
-            st.session_state.vector_store_manager.add_documents(documents)
-            
-            # Get document info
-            doc_info = st.session_state.doc_processor.get_document_info(documents)
-            
-            st.success(
-                f"✅ {uploaded_file.name}: {doc_info['total_chunks']} chunks created"
+            # Update progress
+            progress_bar.progress((idx + 1) / len(uploaded_files))
+    
+    # Index every file's chunks in one call so the embedder sees full batches
+    if processed:
+        status_text.text(f"Indexing {len(processed)} document(s)...")
+        all_documents = [doc for _, documents, _ in processed for doc in documents]
+        try:
+            vector_store_manager.add_documents(
+                all_documents,
+                documents_meta=[document_meta for _, _, document_meta in processed]
             )
-            success_count += 1
+            
+            for file_name, documents, document_meta in processed:
+                doc_info = doc_processor.get_document_info(documents, document_meta)
+                st.success(
+                    f"✅ {file_name}: {doc_info['total_chunks']} chunks created"
+                )
+            success_count += len(processed)
             
         except Exception as e:
-            st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
-            error_count += 1
-        
-        # Update progress
-        progress_bar.progress((idx + 1) / len(uploaded_files))
+            st.error(f"❌ Error indexing documents: {str(e)}")
+            error_count += len(processed)
     
     status_text.empty()
     progress_bar.empty()
@@ -192,6 +277,7 @@ def display_sidebar():
                 st.error("Please initialize the system first (enter API key)")
             else:
                 handle_file_upload(uploaded_files)
+                st.session_state.semantic_cache.clear()
         
         st.markdown("---")
         
@@ -214,6 +300,7 @@ def display_sidebar():
                         if st.button("🗑️", key=f"del_{doc}"):
                             try:
                                 st.session_state.vector_store_manager.delete_document(doc)
+                                st.session_state.semantic_cache.clear()
                                 st.rerun()
                             except Exception as e:
                                 st.error(f"Error: {str(e)}")
@@ -228,6 +315,7 @@ def display_sidebar():
                 try:
                     st.session_state.vector_store_manager.clear_all_documents()
                     st.session_state.chat_history = []
+                    st.session_state.semantic_cache.clear()
                     st.success("All data cleared")
                     st.rerun()
                 except Exception as e:
@@ -250,19 +338,28 @@ def display_chat_interface():
         st.info("📤 Upload documents in the sidebar to start asking questions")
         return
     
-    # Display chat history
-    if st.session_state.chat_history:
-        st.markdown("### 💬 Conversation History")
-        for chat in st.session_state.chat_history:
-            st.markdown(f"**Q:** {chat['question']}")
-            st.markdown(f"<div class='chat-message'>{chat['answer']}</div>", 
-                       unsafe_allow_html=True)
-            
-            if chat['sources']:
-                with st.expander("📎 View Sources"):
-                    st.markdown(f"<div class='source-citation'>{chat['sources']}</div>", unsafe_allow_html=True)
-            
-            st.markdown("---")
+    display_chat_panel()
+
+
+def render_sources(sources: str):
+    """Render the source citations and separator of a chat entry"""
+    if sources:
+        with st.expander("📎 View Sources"):
+            st.markdown(f"<div class='source-citation'>{sources}</div>", unsafe_allow_html=True)
+    
+    st.markdown("---")
+
+
+@st.fragment
+def display_chat_panel():
+    """Render conversation history and question input
+    
+    Runs as a fragment: asking a question reruns only this panel, and the
+    new answer is appended in place instead of rerunning the whole app.
+    """
+    # History goes above the input but is filled in below, so a new answer
+    # can be appended to it during this run
+    history = st.container()
     
     # Query input
     st.markdown("### 🔍 Ask a Question")
@@ -279,6 +376,16 @@ def display_chat_interface():
     with col2:
         ask_button = st.button("Ask", type="primary", use_container_width=True)
     
+    # Display chat history
+    with history:
+        if st.session_state.chat_history:
+            st.markdown("### 💬 Conversation History")
+            for chat in st.session_state.chat_history:
+                st.markdown(f"**Q:** {chat['question']}")
+                st.markdown(f"<div class='chat-message'>{chat['answer']}</div>", 
+                           unsafe_allow_html=True)
+                render_sources(chat['sources'])
+    
     # Process question
     if ask_button and question:
         if not question.strip():
@@ -287,29 +394,62 @@ def display_chat_interface():
         
         try:
             with st.spinner("🤔 Thinking..."):
-                # Get vector store
-                vector_store = st.session_state.vector_store_manager.get_vector_store()
-                
-                # Ask question
-                result = st.session_state.qa_manager.ask_question(
-                    question, 
-                    vector_store
-                )
+                # Reuse the answer to a near-identical earlier question, unless
+                # any session has changed the documents since it was cached
+                store_version = st.session_state.vector_store_manager.version
+                query_vector = st.session_state.vector_store_manager.get_query_embedding(question)
+                cached = st.session_state.semantic_cache.lookup(query_vector, store_version)
                 
-                # Format sources
-                sources = st.session_state.qa_manager.format_sources(
-                    result['source_documents']
-                )
+                if cached is None:
+                    # Get vector store
+                    vector_store = st.session_state.vector_store_manager.get_vector_store()
+                    
+                    # Retrieve sources; the answer is generated while streaming
+                    result = st.session_state.qa_manager.stream_question(
+                        question, 
+                        vector_store
+                    )
+            
+            with history:
+                if not st.session_state.chat_history:
+                    st.markdown("### 💬 Conversation History")
+                st.markdown(f"**Q:** {question}")
                 
-                # Add to chat history
-                st.session_state.chat_history.append({
-                    'question': question,
-                    'answer': result['answer'],
-                    'sources': sources
-                })
+                if cached is None:
+                    # Show the answer token by token as Gemini produces it,
+                    # then restyle it like cached and history answers
+                    answer_slot = st.empty()
+                    answer = answer_slot.write_stream(result['answer_stream'])
+                    answer_slot.markdown(f"<div class='chat-message'>{answer.strip()}</div>", 
+                                         unsafe_allow_html=True)
+                    
+                    # Format sources
+                    source_documents = result['source_documents']
+                    sources = st.session_state.qa_manager.format_sources(
+                        source_documents,
+                        st.session_state.vector_store_manager.get_documents_meta(
+                            [doc.metadata.get("source") for doc in source_documents]
+                        )
+                    )
+                    
+                    cached = {'answer': answer.strip(), 'sources': sources}
+                    st.session_state.semantic_cache.put(
+                        query_vector, 
+                        cached, 
+                        st.session_state.vector_store_manager.version
+                    )
+                else:
+                    st.markdown(f"<div class='chat-message'>{cached['answer']}</div>", 
+                               unsafe_allow_html=True)
                 
-                # Rerun to display new message
-                st.rerun()
+                render_sources(cached['sources'])
+            
+            # Add to chat history
+            st.session_state.chat_history.append({
+                'question': question,
+                'answer': cached['answer'],
+                'sources': cached['sources']
+            })
         
         except Exception as e:
             st.error(f"❌ Error: {str(e)}")
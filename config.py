@@ -14,26 +14,86 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", "")
 
 # Embedding Model Configuration
 EMBEDDING_MODEL = "all-mpnet-base-v2"
+EMBEDDING_BATCH_SIZE = 64
+# Inference backend: "onnx" (ONNX Runtime, int8-quantized export; needs
+# optimum[onnxruntime], falls back to torch if unavailable) or "torch"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "onnx").lower()
+# Quantized ONNX export to load; empty picks the best one for this CPU
+# (VNNI, AVX-512, AVX2 or ARM64 int8 kernels)
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")
 
 # Document Processing Configuration
-CHUNK_SIZE = 1000
+# Chunk sizes are in characters. At roughly 4 characters per token, 1200
+# characters is ~300 tokens, leaving a margin under the 384 tokens
+# all-mpnet-base-v2 reads (text past that is silently truncated)
+CHUNK_SIZE = 1200
 CHUNK_OVERLAP = 200
 MAX_FILE_SIZE_MB = 10
 MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+MAX_UPLOAD_WORKERS = 8
+# Number of recently extracted documents whose cleaned text is kept in memory
+EXTRACTION_CACHE_SIZE = 64
 
 # Supported file formats
 SUPPORTED_FORMATS = [".pdf", ".txt", ".docx"]
 
+# PDF text extraction backend: "pypdfium2" (native PDFium, fast) or "pypdf2"
+PDF_BACKEND = os.getenv("PDF_BACKEND", "pypdfium2").lower()
+# PDFs with at least this many pages are extracted across worker processes
+# (PDFium backend only). A worker costs ~100 ms to start against ~1.7 ms per
+# page in-process, so splitting only pays off past ~80-120 pages
+PDF_PARALLEL_MIN_PAGES = 128
+PDF_EXTRACT_WORKERS = min(4, os.cpu_count() or 1)
+
 # ChromaDB Configuration
 CHROMA_DB_PATH = "./chroma_db"
 COLLECTION_NAME = "documents"
+# Per-document metadata (total_chunks, pages, content hash, ...) kept once
+# per document instead of on every chunk
+DOCUMENTS_META_PATH = os.path.join(CHROMA_DB_PATH, "documents_meta.sqlite3")
+# HNSW index parameters, applied when the collection is created. Embeddings
+# are normalized, so cosine space ranks like L2 without extra work
+HNSW_SPACE = "cosine"
+HNSW_M = 32
+HNSW_CONSTRUCTION_EF = 200
+HNSW_SEARCH_EF = 32
+# Collections smaller than this are searched with ef_search = chunk count,
+# i.e. effectively exact
+HNSW_EXACT_SEARCH_MAX_CHUNKS = 2000
+
+# Embedding Cache Configuration
+EMBEDDING_CACHE_PATH = "./embedding_cache/embeddings.sqlite3"
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000
+# Storage precision of cached vectors: "float16" (2x smaller) or "float32"
+# (exact). Cache hits are indexed in Chroma as-is, so nothing coarser than
+# float16 is offered (its cosine error is ~1e-7)
+EMBEDDING_CACHE_QUANTIZATION = "float16"
+# In-memory cache of query embeddings, so repeated questions skip the encoder
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = 3600
 
 # Vector Search Configuration
 TOP_K_RESULTS = 4
+# "similarity" (nearest chunks) or "mmr" (maximal marginal relevance: re-rank
+# MMR_FETCH_K nearest chunks for diversity; 1.0 = pure relevance)
+RETRIEVAL_SEARCH_TYPE = os.getenv("RETRIEVAL_SEARCH_TYPE", "similarity").lower()
+MMR_FETCH_K = 20
+MMR_LAMBDA = 0.5
+
+# Semantic Cache Configuration (reuse answers to near-identical questions)
+# Disable when every question must be answered from a fresh LLM call
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Cosine similarity a question must reach to reuse a cached answer; kept
+# high so differently worded questions with different answers don't collide
+SEMANTIC_CACHE_THRESHOLD = 0.97
+SEMANTIC_CACHE_TTL_SECONDS = 3600
+SEMANTIC_CACHE_MAX_ENTRIES = 512
 
 # LLM Configuration
 GEMINI_MODEL = "gemini-2.5-flash"
 TEMPERATURE = 0.7
+# Maximum Gemini requests in flight when answering a batch of questions
+MAX_CONCURRENT_QUESTIONS = 8
 
 # UI Configuration
 APP_TITLE = "Luno AI"
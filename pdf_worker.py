@@ -0,0 +1,45 @@
+"""
+PDF Worker Module
+PDFium page text extraction, runnable as a standalone script so large PDFs
+can be split across processes that load nothing but pypdfium2
+
+Usage: python pdf_worker.py START STOP [PATH]
+Reads the PDF from PATH, or from stdin when no path is given, and writes the
+text of pages [START, STOP) to stdout as a JSON list
+"""
+
+import sys
+import json
+import threading
+from typing import List, Union
+
+import pypdfium2 as pdfium
+
+# PDFium is not thread-safe, not even across different documents, so every
+# in-process PDFium call is serialized; worker processes each have their own
+PDFIUM_LOCK = threading.Lock()
+
+
+def pdfium_page_texts(source: Union[bytes, str], start: int, stop: int) -> List[str]:
+    """Extract raw text of pages [start, stop) with PDFium"""
+    with PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(source)
+        try:
+            texts = []
+            for index in range(start, stop):
+                page = pdf[index]
+                textpage = page.get_textpage()
+                # PDFium already joins words hyphenated across a line break
+                # and leaves U+FFFE where the hyphen was
+                texts.append(textpage.get_text_range().replace("\ufffe", ""))
+                textpage.close()
+                page.close()
+            return texts
+        finally:
+            pdf.close()
+
+
+if __name__ == "__main__":
+    start, stop = int(sys.argv[1]), int(sys.argv[2])
+    source = sys.argv[3] if len(sys.argv) > 3 else sys.stdin.buffer.read()
+    json.dump(pdfium_page_texts(source, start, stop), sys.stdout)
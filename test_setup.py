@@ -110,7 +110,7 @@ def test_document_processor():
         
         # Test with sample text
         sample_text = b"This is a test document. " * 100
-        is_valid, msg = processor.validate_file("test.txt", len(sample_text))
+        is_valid, msg, _ = processor.validate_file("test.txt", len(sample_text))
         
         if is_valid:
             print("✅ Document validation works")
@@ -4,16 +4,80 @@ Handles document loading, text extraction, and chunking for various file formats
 """
 
 import os
-from typing import List, Dict, Any
+import hashlib
+import sys
+import json
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Union
 from io import BytesIO
 
+import charset_normalizer
 import PyPDF2
 from docx import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document as LangChainDocument
 import re
 
-from config import CHUNK_SIZE, CHUNK_OVERLAP, SUPPORTED_FORMATS, MAX_FILE_SIZE_BYTES
+from config import (
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    EXTRACTION_CACHE_SIZE,
+    SUPPORTED_FORMATS,
+    MAX_FILE_SIZE_BYTES,
+    PDF_BACKEND,
+    PDF_EXTRACT_WORKERS,
+    PDF_PARALLEL_MIN_PAGES
+)
+
+try:
+    import pypdfium2 as pdfium
+    import pdf_worker
+    from pdf_worker import PDFIUM_LOCK, pdfium_page_texts
+except ImportError:  # Fall back to PyPDF2 when PDFium bindings are unavailable
+    pdfium = None
+
+
+# File content as raw bytes, or a path to the file on disk
+FileSource = Union[bytes, str]
+
+
+def _as_file(source: FileSource):
+    """Wrap raw bytes in a stream; paths are handed to the parser as-is"""
+    return BytesIO(source) if isinstance(source, bytes) else source
+
+
+def _pdfium_page_texts_subprocess(source: FileSource, start: int, stop: int) -> List[str]:
+    """Extract raw text of pages [start, stop) in a separate pdf_worker process"""
+    args = [sys.executable, pdf_worker.__file__, str(start), str(stop)]
+    if isinstance(source, str):
+        args.append(source)
+    result = subprocess.run(
+        args,
+        input=source if isinstance(source, bytes) else None,
+        capture_output=True
+    )
+    if result.returncode != 0:
+        # A crash (e.g. PDFium on a malformed file) only takes down this
+        # worker; it surfaces as an extraction error for this document
+        detail = result.stderr.decode(errors="replace").strip().splitlines()
+        raise RuntimeError(
+            f"PDF worker exited with code {result.returncode}"
+            + (f": {detail[-1]}" if detail else "")
+        )
+    return json.loads(result.stdout)
+
+
+# Text cleanup patterns, compiled once for all documents. Each starts with a
+# literal character where possible, so the regex engine can jump straight to
+# candidate positions instead of attempting a match at every character.
+_HYPHEN_BREAK_RE = re.compile(r"-\n(?=\w)(?<=\w-\n)")
+_PAGE_MARKER_RE = re.compile(r"\s*--- Page \d+ ---\s*")
+_SINGLE_NEWLINE_RE = re.compile(r"\n(?<!\n\n)(?!\n)")
+_MULTI_NEWLINE_RE = re.compile(r"\n\n\n+")
+_MULTI_SPACE_RE = re.compile(r"[ \t][ \t]+")
 
 
 class DocumentProcessor:
@@ -21,14 +85,28 @@ class DocumentProcessor:
     
     def __init__(self):
         """Initialize the document processor with text splitter"""
+        # Chunks are measured in characters rather than tokens: the splitter
+        # measures every piece it considers (down to single words), so a
+        # tokenizer-based length would dominate processing time
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=CHUNK_SIZE,
             chunk_overlap=CHUNK_OVERLAP,
             length_function=len,
             separators=["\n\n", "\n", " ", ""]
         )
+        
+        # Text extractor per supported file extension
+        self._extractors = {
+            ".pdf": self.extract_text_from_pdf,
+            ".docx": self.extract_text_from_docx,
+            ".txt": self.extract_text_from_txt,
+        }
+        
+        # Recently extracted (text, metadata), keyed by (content hash, extension)
+        self._extraction_cache: OrderedDict = OrderedDict()
+        self._extraction_cache_lock = threading.Lock()
     
-    def validate_file(self, file_name: str, file_size: int) -> tuple[bool, str]:
+    def validate_file(self, file_name: str, file_size: int) -> tuple[bool, str, str]:
         """
         Validate file format and size
         
@@ -37,18 +115,18 @@ class DocumentProcessor:
             file_size: Size of the file in bytes
             
         Returns:
-            Tuple of (is_valid, error_message)
+            Tuple of (is_valid, error_message, file_extension)
         """
         # Check file extension
         file_ext = os.path.splitext(file_name)[1].lower()
         if file_ext not in SUPPORTED_FORMATS:
-            return False, f"Unsupported file format. Supported formats: {', '.join(SUPPORTED_FORMATS)}"
+            return False, f"Unsupported file format. Supported formats: {', '.join(SUPPORTED_FORMATS)}", file_ext
         
         # Check file size
         if file_size > MAX_FILE_SIZE_BYTES:
-            return False, f"File size exceeds {MAX_FILE_SIZE_BYTES / (1024*1024)}MB limit"
+            return False, f"File size exceeds {MAX_FILE_SIZE_BYTES / (1024*1024)}MB limit", file_ext
         
-        return True, ""
+        return True, "", file_ext
     
     def _clean_text(self, text: str) -> str:
         """
@@ -59,69 +137,115 @@ class DocumentProcessor:
         """
         if not text:
             return ""
-        # Normalize line endings
-        text = text.replace("\r", "\n")
+        # Normalize line endings (PDFium emits CRLF)
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
         # Fix hyphenated line breaks: "exam-\nple" -> "example"
-        text = re.sub(r"(\w)-\n(\w)", r"\1\2", text)
-        # Remove page markers that add noise
-        text = re.sub(r"\s*--- Page \d+ ---\s*", "\n", text)
+        text = _HYPHEN_BREAK_RE.sub("", text)
+        # Remove page markers that add noise (substring check is far cheaper
+        # than a regex scan when there are none)
+        if "--- Page" in text:
+            text = _PAGE_MARKER_RE.sub("\n", text)
         # Replace single newlines (not part of a blank-line paragraph break) with spaces
-        text = re.sub(r"(?<!\n)\n(?!\n)", " ", text)
+        text = _SINGLE_NEWLINE_RE.sub(" ", text)
         # Collapse 3+ newlines to 2 (paragraph break)
-        text = re.sub(r"\n{3,}", "\n\n", text)
+        text = _MULTI_NEWLINE_RE.sub("\n\n", text)
         # Collapse repeated spaces
-        text = re.sub(r"[ \t]{2,}", " ", text)
+        text = _MULTI_SPACE_RE.sub(" ", text)
         return text.strip()
 
-    def extract_text_from_pdf(self, file_bytes: bytes) -> tuple[str, Dict[str, Any]]:
+    def _read_pdf_pages_pypdf2(self, source: FileSource) -> tuple[List[str], Dict[str, Any]]:
+        """Extract raw per-page text and metadata using PyPDF2"""
+        pdf_reader = PyPDF2.PdfReader(_as_file(source))
+        metadata = {"pages": len(pdf_reader.pages)}
+        # Try to capture PDF title from metadata
+        try:
+            info = getattr(pdf_reader, "metadata", None) or {}
+            title = None
+            if isinstance(info, dict):
+                title = info.get("/Title") or info.get("Title")
+            else:
+                # PyPDF2 sometimes exposes attributes
+                title = getattr(info, "title", None)
+            if title and isinstance(title, str) and title.strip():
+                metadata["doc_title"] = title.strip()
+        except Exception:
+            pass
+        
+        pages = [page.extract_text() or "" for page in pdf_reader.pages]
+        return pages, metadata
+    
+    def _read_pdf_pages_pdfium(self, source: FileSource) -> tuple[List[str], Dict[str, Any]]:
+        """Extract raw per-page text and metadata using PDFium"""
+        with PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(source)
+            try:
+                page_count = len(pdf)
+                metadata = {"pages": page_count}
+                try:
+                    title = pdf.get_metadata_dict().get("Title")
+                    if title and title.strip():
+                        metadata["doc_title"] = title.strip()
+                except Exception:
+                    pass
+            finally:
+                pdf.close()
+        
+        if page_count < PDF_PARALLEL_MIN_PAGES or PDF_EXTRACT_WORKERS < 2:
+            return pdfium_page_texts(source, 0, page_count), metadata
+        
+        # Large document: each pdf_worker process opens the file and extracts
+        # a contiguous page range; results are stitched back in page order.
+        # The workers exit when done, so nothing is held between uploads
+        step = -(-page_count // PDF_EXTRACT_WORKERS)
+        with ThreadPoolExecutor(max_workers=PDF_EXTRACT_WORKERS) as executor:
+            chunks = executor.map(
+                lambda start: _pdfium_page_texts_subprocess(
+                    source, start, min(start + step, page_count)
+                ),
+                range(0, page_count, step)
+            )
+            pages = [text for chunk in chunks for text in chunk]
+        return pages, metadata
+    
+    def extract_text_from_pdf(self, source: FileSource) -> tuple[str, Dict[str, Any]]:
         """
         Extract text from PDF file
         
+        Uses PDFium when available and PDF_BACKEND is "pypdfium2",
+        otherwise PyPDF2.
+        
         Args:
-            file_bytes: PDF file content as bytes
+            source: PDF file content as bytes, or a path to the file
             
         Returns:
             Tuple of (extracted_text, metadata)
         """
-        text = ""
-        metadata = {"pages": 0}
-        
         try:
-            pdf_file = BytesIO(file_bytes)
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            metadata["pages"] = len(pdf_reader.pages)
-            # Try to capture PDF title from metadata
-            try:
-                info = getattr(pdf_reader, "metadata", None) or {}
-                title = None
-                if isinstance(info, dict):
-                    title = info.get("/Title") or info.get("Title")
-                else:
-                    # PyPDF2 sometimes exposes attributes
-                    title = getattr(info, "title", None)
-                if title and isinstance(title, str) and title.strip():
-                    metadata["doc_title"] = title.strip()
-            except Exception:
-                pass
-            
-            for page_num, page in enumerate(pdf_reader.pages):
-                page_text = page.extract_text()
-                if page_text:
-                    text += f"\n--- Page {page_num + 1} ---\n{page_text}"
-            
+            if PDF_BACKEND == "pypdfium2" and pdfium is not None:
+                pages, metadata = self._read_pdf_pages_pdfium(source)
+            else:
+                pages, metadata = self._read_pdf_pages_pypdf2(source)
         except Exception as e:
             raise ValueError(f"Error extracting text from PDF: {str(e)}")
         
-        # Clean up broken formatting common in PDFs
-        text = self._clean_text(text)
+        # Clean each page on its own and join once at the end, so large
+        # PDFs don't pay for repeated string concatenation
+        page_texts = []
+        for page_text in pages:
+            page_text = self._clean_text(page_text)
+            if page_text:
+                page_texts.append(page_text)
+        
+        text = "\n\n".join(page_texts)
         return text, metadata
     
-    def extract_text_from_docx(self, file_bytes: bytes) -> tuple[str, Dict[str, Any]]:
+    def extract_text_from_docx(self, source: FileSource) -> tuple[str, Dict[str, Any]]:
         """
         Extract text from DOCX file
         
         Args:
-            file_bytes: DOCX file content as bytes
+            source: DOCX file content as bytes, or a path to the file
             
         Returns:
             Tuple of (extracted_text, metadata)
@@ -130,13 +254,11 @@ class DocumentProcessor:
         metadata = {"paragraphs": 0}
         
         try:
-            docx_file = BytesIO(file_bytes)
-            doc = Document(docx_file)
+            doc = Document(_as_file(source))
             
-            paragraphs = []
-            for para in doc.paragraphs:
-                if para.text.strip():
-                    paragraphs.append(para.text)
+            # Read each paragraph's text once; skip empty and whitespace-only ones
+            paragraphs = [text for text in (para.text for para in doc.paragraphs)
+                          if text and not text.isspace()]
             
             metadata["paragraphs"] = len(paragraphs)
             # DOCX title if available
@@ -155,12 +277,12 @@ class DocumentProcessor:
         text = self._clean_text(text)
         return text, metadata
     
-    def extract_text_from_txt(self, file_bytes: bytes) -> tuple[str, Dict[str, Any]]:
+    def extract_text_from_txt(self, source: FileSource) -> tuple[str, Dict[str, Any]]:
         """
         Extract text from TXT file
         
         Args:
-            file_bytes: TXT file content as bytes
+            source: TXT file content as bytes, or a path to the file
             
         Returns:
             Tuple of (extracted_text, metadata)
@@ -168,49 +290,110 @@ class DocumentProcessor:
         text = ""
         metadata = {}
         
+        if isinstance(source, bytes):
+            file_bytes = source
+        else:
+            with open(source, "rb") as f:
+                file_bytes = f.read()
+        
         try:
             text = file_bytes.decode('utf-8')
-            metadata["lines"] = len(text.split('\n'))
         except UnicodeDecodeError:
+            # Only non-UTF-8 files pay for encoding detection
             try:
-                text = file_bytes.decode('latin-1')
-                metadata["lines"] = len(text.split('\n'))
+                best = charset_normalizer.from_bytes(file_bytes).best()
+                text = str(best) if best is not None else file_bytes.decode('latin-1')
             except Exception as e:
                 raise ValueError(f"Error decoding text file: {str(e)}")
         
+        # Count lines without materializing a list of them
+        metadata["lines"] = text.count('\n') + 1
+        
         # Use filename (without extension) as title fallback
         metadata["doc_title"] = metadata.get("doc_title") or os.path.splitext("unknown.txt")[0]
         
         text = self._clean_text(text)
         return text, metadata
     
-    def process_document(self, file_name: str, file_bytes: bytes) -> List[LangChainDocument]:
+    def compute_content_hash(self, source: FileSource) -> str:
+        """
+        Compute the SHA-256 hex digest of a file's content
+        
+        Args:
+            source: File content as bytes, or a path to the file
+            
+        Returns:
+            Hex digest identifying the content
+        """
+        if isinstance(source, bytes):
+            return hashlib.sha256(source).hexdigest()
+        
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    def process_document(
+        self, 
+        file_name: str, 
+        file_bytes: bytes,
+        content_hash: Optional[str] = None
+    ) -> tuple[List[LangChainDocument], Dict[str, Any]]:
         """
         Process a document: extract text, chunk it, and create LangChain documents
         
         Args:
             file_name: Name of the file
             file_bytes: File content as bytes
+            content_hash: Precomputed content hash (computed if omitted)
             
         Returns:
-            List of LangChain Document objects with chunks and metadata
+            Tuple of (chunk Documents carrying source and chunk_index,
+            document-level metadata such as total_chunks, content_hash and
+            page/paragraph/line counts)
+        """
+        return self._process(file_name, file_bytes, len(file_bytes), content_hash)
+    
+    def process_document_path(
+        self, 
+        file_name: str, 
+        file_path: str,
+        content_hash: Optional[str] = None
+    ) -> tuple[List[LangChainDocument], Dict[str, Any]]:
         """
+        Process a document stored on disk, letting the parsers read it directly
+        
+        Args:
+            file_name: Original name of the file (used for type and citations)
+            file_path: Path to the file content
+            content_hash: Precomputed content hash (computed if omitted)
+            
+        Returns:
+            Tuple of (chunk Documents carrying source and chunk_index,
+            document-level metadata such as total_chunks, content_hash and
+            page/paragraph/line counts)
+        """
+        return self._process(file_name, file_path, os.path.getsize(file_path), content_hash)
+    
+    def _process(
+        self, 
+        file_name: str, 
+        source: FileSource, 
+        file_size: int,
+        content_hash: Optional[str]
+    ) -> tuple[List[LangChainDocument], Dict[str, Any]]:
+        """Validate, extract, and chunk a document from bytes or a path"""
         # Validate file
-        is_valid, error_msg = self.validate_file(file_name, len(file_bytes))
+        is_valid, error_msg, file_ext = self.validate_file(file_name, file_size)
         if not is_valid:
             raise ValueError(error_msg)
         
-        # Extract text based on file type
-        file_ext = os.path.splitext(file_name)[1].lower()
+        if content_hash is None:
+            content_hash = self.compute_content_hash(source)
         
-        if file_ext == ".pdf":
-            text, doc_metadata = self.extract_text_from_pdf(file_bytes)
-        elif file_ext == ".docx":
-            text, doc_metadata = self.extract_text_from_docx(file_bytes)
-        elif file_ext == ".txt":
-            text, doc_metadata = self.extract_text_from_txt(file_bytes)
-        else:
-            raise ValueError(f"Unsupported file format: {file_ext}")
+        # Extract text based on file type
+        text, doc_metadata = self._extract_cached(file_ext, source, content_hash)
         
         # Check if text was extracted
         if not text or not text.strip():
@@ -219,27 +402,66 @@ class DocumentProcessor:
         # Split text into chunks
         chunks = self.text_splitter.split_text(text)
         
-        # Create LangChain documents with metadata
-        documents = []
-        for idx, chunk in enumerate(chunks):
-            title_fallback = os.path.splitext(os.path.basename(file_name))[0]
-            metadata = {
-                "source": file_name,
-                "chunk_index": idx,
-                "total_chunks": len(chunks),
-                "doc_title": (doc_metadata.get("doc_title") if isinstance(doc_metadata, dict) else None) or title_fallback,
-                **doc_metadata
-            }
-            documents.append(LangChainDocument(page_content=chunk, metadata=metadata))
-        
-        return documents
+        # Document-level metadata is kept once per document rather than
+        # copied onto every chunk
+        title_fallback = os.path.splitext(os.path.basename(file_name))[0]
+        document_meta = {
+            "source": file_name,
+            "total_chunks": len(chunks),
+            "content_hash": content_hash,
+            "doc_title": (doc_metadata.get("doc_title") if isinstance(doc_metadata, dict) else None) or title_fallback,
+            **doc_metadata
+        }
+        
+        # Create LangChain documents with per-chunk metadata
+        documents = [
+            LangChainDocument(
+                page_content=chunk,
+                metadata={"source": file_name, "chunk_index": idx}
+            )
+            for idx, chunk in enumerate(chunks)
+        ]
+        
+        return documents, document_meta
+    
+    def _extract_cached(
+        self, 
+        file_ext: str, 
+        source: FileSource, 
+        content_hash: str
+    ) -> tuple[str, Dict[str, Any]]:
+        """Extract and clean text, reusing the result for content seen recently"""
+        key = (content_hash, file_ext)
+        with self._extraction_cache_lock:
+            cached = self._extraction_cache.get(key)
+            if cached is not None:
+                self._extraction_cache.move_to_end(key)
+                text, doc_metadata = cached
+                return text, dict(doc_metadata)
+        
+        extractor = self._extractors.get(file_ext)
+        if extractor is None:
+            raise ValueError(f"Unsupported file format: {file_ext}")
+        text, doc_metadata = extractor(source)
+        
+        with self._extraction_cache_lock:
+            self._extraction_cache[key] = (text, dict(doc_metadata))
+            if len(self._extraction_cache) > EXTRACTION_CACHE_SIZE:
+                self._extraction_cache.popitem(last=False)
+        
+        return text, doc_metadata
     
-    def get_document_info(self, documents: List[LangChainDocument]) -> Dict[str, Any]:
+    def get_document_info(
+        self, 
+        documents: List[LangChainDocument],
+        document_meta: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """
         Get summary information about processed documents
         
         Args:
             documents: List of LangChain documents
+            document_meta: Document-level metadata returned by process_document
             
         Returns:
             Dictionary with document statistics
@@ -248,11 +470,12 @@ class DocumentProcessor:
             return {"total_chunks": 0, "total_characters": 0}
         
         total_chars = sum(len(doc.page_content) for doc in documents)
+        metadata = {**documents[0].metadata, **(document_meta or {})}
         
         return {
-            "source": documents[0].metadata.get("source", "Unknown"),
+            "source": metadata.get("source", "Unknown"),
             "total_chunks": len(documents),
             "total_characters": total_chars,
-            "metadata": {k: v for k, v in documents[0].metadata.items() 
-                        if k not in ["chunk_index", "total_chunks"]}
+            "metadata": {k: v for k, v in metadata.items() 
+                        if k not in ["chunk_index", "total_chunks", "content_hash"]}
         }
@@ -0,0 +1,218 @@
+"""
+Embedding Cache Module
+Persists chunk embeddings on disk so identical text is only embedded once
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Dict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_QUANTIZATION,
+    QUERY_EMBEDDING_CACHE_SIZE,
+    QUERY_EMBEDDING_CACHE_TTL_SECONDS
+)
+
+
+# SQLite caps the number of bound parameters per statement
+_SQL_BATCH_SIZE = 500
+
+
+def _encode_vector(vector: List[float], quantization: str) -> bytes:
+    """Serialize a vector at the configured precision"""
+    if quantization == "float16":
+        return np.asarray(vector, dtype=np.float16).tobytes()
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _decode_vector(blob: bytes, quantization: str) -> List[float]:
+    """Deserialize a vector back to float32 values"""
+    if quantization == "float16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32).tolist()
+    return np.frombuffer(blob, dtype=np.float32).tolist()
+
+
+class QueryEmbeddingCache:
+    """In-memory LRU cache of query embeddings with a time-to-live"""
+
+    def __init__(
+        self,
+        max_entries: int = QUERY_EMBEDDING_CACHE_SIZE,
+        ttl_seconds: float = QUERY_EMBEDDING_CACHE_TTL_SECONDS
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Least recently used queries beyond this are evicted
+            ttl_seconds: Age after which a cached embedding is recomputed
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(query: str) -> str:
+        """Cache key for a query, ignoring case and surrounding whitespace"""
+        return hashlib.sha256(query.strip().lower().encode("utf-8")).hexdigest()
+
+    def get_or_compute(self, query: str, compute: Callable[[str], List[float]]) -> List[float]:
+        """
+        Return the cached embedding of a query, computing it on a miss
+
+        Args:
+            query: Query string
+            compute: Function that embeds the query
+
+        Returns:
+            Query embedding
+        """
+        key = self._key(query)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        vector = compute(query)
+
+        with self._lock:
+            self._entries[key] = (now, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return vector
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves previously embedded texts from a SQLite cache"""
+
+    def __init__(
+        self,
+        inner: Embeddings,
+        model_name: str,
+        cache_path: str = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+        quantization: str = EMBEDDING_CACHE_QUANTIZATION
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            inner: Embeddings model used for cache misses
+            model_name: Model name, part of the cache key so models never mix
+            cache_path: Path of the SQLite cache file
+            max_entries: Least recently used entries beyond this are evicted
+            quantization: Storage precision: "float16" or "float32"
+        """
+        if quantization not in ("float16", "float32"):
+            raise ValueError(f"Unsupported embedding cache quantization: {quantization}")
+
+        self.inner = inner
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.quantization = quantization
+        self.query_cache = QueryEmbeddingCache()
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vec BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    def _key(self, text: str) -> bytes:
+        """Cache key for a text under the current model and storage precision"""
+        return hashlib.sha256(
+            f"{self.model_name}\0{self.quantization}\0{text}".encode("utf-8")
+        ).digest()
+
+    def _fetch(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """Look up cached vectors for the given keys"""
+        found = {}
+        for start in range(0, len(keys), _SQL_BATCH_SIZE):
+            batch = keys[start:start + _SQL_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT key, vec FROM embeddings WHERE key IN ({placeholders})",
+                batch
+            )
+            for key, vec in rows:
+                found[key] = _decode_vector(vec, self.quantization)
+        return found
+
+    def _evict(self):
+        """Drop least recently used entries beyond max_entries"""
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts, computing only those not already in the cache
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Embedding vectors in the same order as texts
+        """
+        if not texts:
+            return []
+
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            cached = self._fetch(list(set(keys)))
+
+        # Embed each distinct missing text once, even if repeated in the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            new_vectors = self.inner.embed_documents(list(missing.values()))
+            cached.update(zip(missing.keys(), new_vectors))
+
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in cached if key not in missing]
+            )
+            if missing:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vec, last_used) VALUES (?, ?, ?)",
+                    [
+                        (key, _encode_vector(cached[key], self.quantization), now)
+                        for key in missing
+                    ]
+                )
+                self._evict()
+            self._conn.commit()
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a search query, reusing recent embeddings of the same query"""
+        return self.query_cache.get_or_compute(text, self.inner.embed_query)
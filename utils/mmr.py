@@ -0,0 +1,116 @@
+"""
+MMR Module
+Maximal marginal relevance re-ranking of retrieved chunks
+"""
+
+from typing import List
+
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    import simsimd
+except ImportError:  # Fall back to NumPy matrix products
+    simsimd = None
+
+
+# Up to this many candidates SIMD kernels avoid BLAS dispatch overhead;
+# beyond it BLAS is faster
+_SIMSIMD_MAX_CANDIDATES = 64
+
+
+def mmr(
+    query_vector: List[float],
+    candidate_vectors: List[List[float]],
+    lambda_mult: float = 0.5,
+    k: int = 4
+) -> List[int]:
+    """
+    Select diverse, relevant candidates by maximal marginal relevance
+
+    Args:
+        query_vector: Query embedding
+        candidate_vectors: Embeddings of the candidates, one per row
+        lambda_mult: Weight of relevance (1.0) versus diversity (0.0)
+        k: Number of candidates to select
+
+    Returns:
+        Indices of the selected candidates, in selection order
+    """
+    candidates = np.array(candidate_vectors, dtype=np.float32)
+    if candidates.size == 0 or k <= 0:
+        return []
+
+    query = np.asarray(query_vector, dtype=np.float32)
+    candidates /= np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    # All pairwise similarities up front, so the greedy loop below only
+    # indexes arrays (vectors are normalized, so dot product is cosine)
+    if simsimd is not None and len(candidates) <= _SIMSIMD_MAX_CANDIDATES:
+        relevance = np.asarray(simsimd.cdist(query[np.newaxis, :], candidates, metric="dot"))[0]
+        similarity = np.asarray(simsimd.cdist(candidates, candidates, metric="dot"))
+    else:
+        relevance = candidates @ query
+        similarity = candidates @ candidates.T
+
+    k = min(k, len(candidates))
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of each candidate to anything selected so far
+    max_similarity = similarity[:, selected[0]].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < k:
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        chosen = int(np.argmax(scores))
+        selected.append(chosen)
+        available[chosen] = False
+        np.maximum(max_similarity, similarity[:, chosen], out=max_similarity)
+
+    return selected
+
+
+def max_marginal_relevance_search(
+    vector_store,
+    query: str,
+    k: int,
+    fetch_k: int,
+    lambda_mult: float = 0.5
+) -> List[Document]:
+    """
+    Retrieve fetch_k nearest chunks and keep the k most diverse of them
+
+    Args:
+        vector_store: LangChain Chroma vector store
+        query: Search query string
+        k: Number of documents to return
+        fetch_k: Number of nearest candidates to re-rank
+        lambda_mult: Weight of relevance (1.0) versus diversity (0.0)
+
+    Returns:
+        Selected Document objects, in selection order
+    """
+    query_vector = vector_store.embeddings.embed_query(query)
+
+    # One query returns the candidates together with their stored
+    # embeddings, so nothing is re-embedded or fetched a second time
+    results = vector_store._collection.query(
+        query_embeddings=[query_vector],
+        n_results=fetch_k,
+        include=["documents", "metadatas", "embeddings"]
+    )
+    candidates = [
+        Document(page_content=text, metadata=metadata or {}, id=doc_id)
+        for doc_id, text, metadata in zip(
+            results["ids"][0], results["documents"][0], results["metadatas"][0]
+        )
+    ]
+    if len(candidates) <= k:
+        return candidates
+
+    return [
+        candidates[idx]
+        for idx in mmr(query_vector, results["embeddings"][0], lambda_mult=lambda_mult, k=k)
+    ]
@@ -3,13 +3,23 @@ QA Chain Module
 Handles LangChain QA chain setup with Gemini LLM
 """
 
-from typing import Dict, Any, Optional, List
+import asyncio
+from typing import Dict, Any, Optional, List, Iterator, AsyncIterator, Union
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnableLambda
 from langchain_google_genai import ChatGoogleGenerativeAI
 
-from config import GEMINI_MODEL, TEMPERATURE, TOP_K_RESULTS
+from config import (
+    GEMINI_MODEL,
+    TEMPERATURE,
+    TOP_K_RESULTS,
+    RETRIEVAL_SEARCH_TYPE,
+    MMR_FETCH_K,
+    MMR_LAMBDA,
+    MAX_CONCURRENT_QUESTIONS
+)
+from .mmr import max_marginal_relevance_search
 
 
 class QAChainManager:
@@ -27,15 +37,24 @@ class QAChainManager:
             raise ValueError("Google API key is required")
         
         self.api_key = api_key
-        self.llm = None
+        # Created on first use; building the Gemini client is slow
+        self._llm = None
         self.qa_chain = None
         self.retriever = None
-        self._initialize_llm()
+        self._format_docs = None
+        self._chain_vector_store = None
+    
+    @property
+    def llm(self) -> ChatGoogleGenerativeAI:
+        """Gemini LLM, initialized on first access"""
+        if self._llm is None:
+            self._initialize_llm()
+        return self._llm
     
     def _initialize_llm(self):
         """Initialize Gemini LLM"""
         try:
-            self.llm = ChatGoogleGenerativeAI(
+            self._llm = ChatGoogleGenerativeAI(
                 model=GEMINI_MODEL,
                 google_api_key=self.api_key,
                 temperature=TEMPERATURE
@@ -48,10 +67,21 @@ class QAChainManager:
             raise ValueError("Vector store is required")
         
         try:
-            self.retriever = vector_store.as_retriever(
-                search_type="similarity",
-                search_kwargs={"k": TOP_K_RESULTS}
-            )
+            if RETRIEVAL_SEARCH_TYPE == "mmr":
+                self.retriever = RunnableLambda(
+                    lambda question: max_marginal_relevance_search(
+                        vector_store,
+                        question,
+                        k=TOP_K_RESULTS,
+                        fetch_k=MMR_FETCH_K,
+                        lambda_mult=MMR_LAMBDA
+                    )
+                )
+            else:
+                self.retriever = vector_store.as_retriever(
+                    search_type="similarity",
+                    search_kwargs={"k": TOP_K_RESULTS}
+                )
             
             template = """Answer based on context. Be direct and concise (1-3 sentences max).
 
@@ -65,20 +95,26 @@ Answer:"""
             prompt = ChatPromptTemplate.from_template(template)
             
             def format_docs(docs):
-                return "\n\n".join(doc.page_content for doc in docs)
+                # A list lets join size the result in one pass
+                return "\n\n".join([doc.page_content for doc in docs])
             
-            self.qa_chain = (
-                {"context": self.retriever | format_docs, "question": RunnablePassthrough()}
-                | prompt
-                | self.llm
-                | StrOutputParser()
-            )
+            # Prompt -> LLM -> text, fed with already-retrieved context so
+            # each question is embedded and searched only once
+            self.qa_chain = prompt | self.llm | StrOutputParser()
+            self._format_docs = format_docs
             
+            self._chain_vector_store = vector_store
             return self.qa_chain
             
         except Exception as e:
             raise Exception(f"Error creating QA chain: {str(e)}")
     
+    def _ensure_chain(self, vector_store):
+        """Create the QA chain, or rebuild it if the store was recreated
+        (e.g. after clearing all documents)"""
+        if self.qa_chain is None or vector_store is not self._chain_vector_store:
+            self.create_qa_chain(vector_store)
+    
     def ask_question(
         self, 
         question: str, 
@@ -90,13 +126,14 @@ Answer:"""
         if not question or not question.strip():
             raise ValueError("Question cannot be empty")
         
-        # Create or update QA chain
-        if self.qa_chain is None:
-            self.create_qa_chain(vector_store)
+        self._ensure_chain(vector_store)
         
         try:
             source_docs = self.retriever.invoke(question)
-            answer = self.qa_chain.invoke(question)
+            answer = self.qa_chain.invoke({
+                "context": self._format_docs(source_docs),
+                "question": question
+            })
             
             return {
                 "answer": answer.strip(),
@@ -106,12 +143,168 @@ Answer:"""
         except Exception as e:
             raise Exception(f"Error processing question: {str(e)}")
     
-    def format_sources(self, source_documents) -> str:
+    async def aask_question(
+        self, 
+        question: str, 
+        vector_store
+    ) -> Dict[str, Any]:
+        """
+        Async version of ask_question; waits on retrieval and Gemini without
+        blocking the event loop
+        
+        Args:
+            question: User question
+            vector_store: Vector store to retrieve context from
+            
+        Returns:
+            Dict with "answer" and "source_documents"
+        """
+        if not question or not question.strip():
+            raise ValueError("Question cannot be empty")
+        
+        self._ensure_chain(vector_store)
+        
+        try:
+            source_docs = await self.retriever.ainvoke(question)
+            answer = await self.qa_chain.ainvoke({
+                "context": self._format_docs(source_docs),
+                "question": question
+            })
+            
+            return {
+                "answer": answer.strip(),
+                "source_documents": source_docs
+            }
+            
+        except Exception as e:
+            raise Exception(f"Error processing question: {str(e)}")
+    
+    async def abatch_questions(
+        self, 
+        questions: List[str], 
+        vector_store,
+        max_concurrency: int = MAX_CONCURRENT_QUESTIONS
+    ) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        Answer several questions concurrently
+        
+        Args:
+            questions: User questions
+            vector_store: Vector store to retrieve context from
+            max_concurrency: Maximum number of questions in flight at once
+            
+        Returns:
+            One result per question, in order; a failed question yields its
+            exception instead of a result dict
+        """
+        # Build the chain once up front rather than racing in every task
+        self._ensure_chain(vector_store)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def ask(question: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.aask_question(question, vector_store)
+        
+        return await asyncio.gather(
+            *(ask(question) for question in questions),
+            return_exceptions=True
+        )
+    
+    def stream_question(
+        self, 
+        question: str, 
+        vector_store
+    ) -> Dict[str, Any]:
+        """
+        Retrieve sources for a question and stream the answer as it is generated
+        
+        Args:
+            question: User question
+            vector_store: Vector store to retrieve context from
+            
+        Returns:
+            Dict with "source_documents" (retrieved up front) and
+            "answer_stream", an iterator of answer text chunks; the LLM
+            request starts when the stream is first consumed
+        """
+        if not question or not question.strip():
+            raise ValueError("Question cannot be empty")
+        
+        self._ensure_chain(vector_store)
+        
+        try:
+            source_docs = self.retriever.invoke(question)
+            answer_stream: Iterator[str] = self.qa_chain.stream({
+                "context": self._format_docs(source_docs),
+                "question": question
+            })
+            
+            return {
+                "answer_stream": answer_stream,
+                "source_documents": source_docs
+            }
+            
+        except Exception as e:
+            raise Exception(f"Error processing question: {str(e)}")
+    
+    async def astream_question(
+        self, 
+        question: str, 
+        vector_store
+    ) -> Dict[str, Any]:
+        """
+        Async version of stream_question
+        
+        Args:
+            question: User question
+            vector_store: Vector store to retrieve context from
+            
+        Returns:
+            Dict with "source_documents" (retrieved up front) and
+            "answer_stream", an async iterator of answer text chunks
+        """
+        if not question or not question.strip():
+            raise ValueError("Question cannot be empty")
+        
+        self._ensure_chain(vector_store)
+        
+        try:
+            source_docs = await self.retriever.ainvoke(question)
+            answer_stream: AsyncIterator[str] = self.qa_chain.astream({
+                "context": self._format_docs(source_docs),
+                "question": question
+            })
+            
+            return {
+                "answer_stream": answer_stream,
+                "source_documents": source_docs
+            }
+            
+        except Exception as e:
+            raise Exception(f"Error processing question: {str(e)}")
+    
+    # (metadata key, file type label) used to describe each cited document
+    _SUFFIX_KEYS = (("pages", "PDF"), ("paragraphs", "DOCX"), ("lines", "TXT"))
+    
+    @classmethod
+    def _source_suffix(cls, metadata: Dict[str, Any]) -> str:
+        """Describe a document by its type and size, e.g. (PDF, 3 pages)"""
+        for key, label in cls._SUFFIX_KEYS:
+            if key in metadata:
+                return f" ({label}, {metadata[key]} {key})"
+        return ""
+    
+    def format_sources(
+        self, 
+        source_documents, 
+        documents_meta: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> str:
         """
         Format source documents into readable citation text
         
         Args:
             source_documents: List of source Document objects
+            documents_meta: Optional document-level metadata keyed by source
             
         Returns:
             Formatted string with source citations
@@ -119,26 +312,19 @@ Answer:"""
         if not source_documents:
             return "No sources found"
         
-        citations = []
-        seen_sources = set()
-        
+        # The dict keeps the first document of each source, in order
+        documents_meta = documents_meta or {}
+        unique_sources = {}
         for doc in source_documents:
             source = doc.metadata.get("source", "Unknown")
-            
-            # Only include each source once
-            if source not in seen_sources:
-                seen_sources.add(source)
-                
-                # Get additional metadata
-                chunk_info = ""
-                if "pages" in doc.metadata:
-                    chunk_info = f" (PDF, {doc.metadata['pages']} pages)"
-                elif "paragraphs" in doc.metadata:
-                    chunk_info = f" (DOCX, {doc.metadata['paragraphs']} paragraphs)"
-                elif "lines" in doc.metadata:
-                    chunk_info = f" (TXT, {doc.metadata['lines']} lines)"
-                
-                citations.append(f"• {source}{chunk_info}")
+            if source not in unique_sources:
+                unique_sources[source] = doc.metadata
+        
+        # Size details are stored per document, not per chunk
+        citations = [
+            "• " + source + self._source_suffix({**metadata, **documents_meta.get(source, {})})
+            for source, metadata in unique_sources.items()
+        ]
         
         return "\n".join(citations)
     
@@ -152,8 +338,10 @@ Answer:"""
         for idx, doc in enumerate(source_documents, 1):
             source = doc.metadata.get("source", "Unknown")
             chunk_idx = doc.metadata.get("chunk_index", "?")
-            preview = doc.page_content.replace("\n", " ")
-            if len(preview) > 180:
-                preview = preview[:180] + "..."
+            # Truncate before replacing so only the preview is copied
+            content = doc.page_content
+            preview = content[:180].replace("\n", " ")
+            if len(content) > 180:
+                preview += "..."
             lines.append(f"• {source} (chunk {chunk_idx}): {preview}")
         return "\n".join(lines)
@@ -0,0 +1,135 @@
+"""
+Semantic Cache Module
+Reuses answers for questions that closely match ones already asked
+"""
+
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+
+from config import (
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_TTL_SECONDS,
+    SEMANTIC_CACHE_MAX_ENTRIES
+)
+
+
+class SemanticCache:
+    """In-memory cache of answers, looked up by question embedding similarity"""
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        enabled: bool = SEMANTIC_CACHE_ENABLED
+    ):
+        """
+        Initialize the cache
+
+        Args:
+            threshold: Minimum cosine similarity for a cached answer to be reused
+            ttl_seconds: Age after which cached answers expire
+            max_entries: Least recently used answers beyond this are evicted
+            enabled: When False, lookups always miss and nothing is stored
+        """
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._vectors: Optional[np.ndarray] = None
+        self._values: List[Any] = []
+        self._timestamps: List[float] = []
+        self._last_used: List[float] = []
+        # Version of the document store the cached answers were built from
+        self._store_version: Optional[int] = None
+
+    def _expire(self):
+        """Drop entries older than the TTL"""
+        cutoff = time.time() - self.ttl_seconds
+        keep = [i for i, ts in enumerate(self._timestamps) if ts >= cutoff]
+        if len(keep) == len(self._timestamps):
+            return
+        self._values = [self._values[i] for i in keep]
+        self._timestamps = [self._timestamps[i] for i in keep]
+        self._last_used = [self._last_used[i] for i in keep]
+        self._vectors = self._vectors[keep] if keep else None
+
+    def _evict_lru(self):
+        """Drop the least recently used entry"""
+        oldest = int(np.argmin(self._last_used))
+        del self._values[oldest]
+        del self._timestamps[oldest]
+        del self._last_used[oldest]
+        self._vectors = np.delete(self._vectors, oldest, axis=0) if self._values else None
+
+    def lookup(self, query_vector: List[float], store_version: Optional[int] = None) -> Optional[Any]:
+        """
+        Find a cached answer for a question
+
+        Args:
+            query_vector: L2-normalized embedding of the question
+            store_version: Current version of the document store; answers
+                cached under another version are discarded
+
+        Returns:
+            The cached value of the most similar question, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        if store_version != self._store_version:
+            self.clear()
+            self._store_version = store_version
+
+        self._expire()
+        if self._vectors is None:
+            return None
+
+        # Embeddings are normalized, so the dot product is the cosine similarity
+        sims = self._vectors @ np.asarray(query_vector, dtype=np.float32)
+        best = int(np.argmax(sims))
+        if sims[best] >= self.threshold:
+            self._last_used[best] = time.time()
+            return self._values[best]
+        return None
+
+    def put(self, query_vector: List[float], value: Any, store_version: Optional[int] = None):
+        """
+        Store the answer for a question
+
+        Args:
+            query_vector: L2-normalized embedding of the question
+            value: Answer payload to return on future matches
+            store_version: Current version of the document store; the answer
+                is not cached if the store changed since the lookup
+        """
+        if not self.enabled:
+            return
+
+        # The documents changed while the answer was being generated
+        if store_version != self._store_version:
+            return
+
+        self._expire()
+        while self._values and len(self._values) >= self.max_entries:
+            self._evict_lru()
+
+        vector = np.asarray(query_vector, dtype=np.float32)[np.newaxis, :]
+        if self._vectors is None:
+            self._vectors = vector
+        else:
+            self._vectors = np.vstack([self._vectors, vector])
+        now = time.time()
+        self._values.append(value)
+        self._timestamps.append(now)
+        self._last_used.append(now)
+
+    def clear(self):
+        """Remove all cached answers"""
+        self._vectors = None
+        self._values = []
+        self._timestamps = []
+        self._last_used = []
@@ -4,6 +4,12 @@ Manages ChromaDB operations for document storage and retrieval
 """
 
 import os
+import json
+import functools
+import logging
+import platform
+import sqlite3
+import threading
 from typing import List, Dict, Any, Optional
 import chromadb
 from chromadb.config import Settings
@@ -11,7 +17,123 @@ from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
 
-from config import CHROMA_DB_PATH, COLLECTION_NAME, EMBEDDING_MODEL, TOP_K_RESULTS
+from config import (
+    CHROMA_DB_PATH,
+    COLLECTION_NAME,
+    DOCUMENTS_META_PATH,
+    HNSW_SPACE,
+    HNSW_M,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_SEARCH_EF,
+    HNSW_EXACT_SEARCH_MAX_CHUNKS,
+    EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BACKEND,
+    EMBEDDING_ONNX_FILE,
+    TOP_K_RESULTS
+)
+from .embedding_cache import CachedEmbeddings
+
+
+logger = logging.getLogger(__name__)
+
+# Index settings for newly created collections; existing collections keep
+# the index they were built with
+_COLLECTION_METADATA = {
+    "hnsw:space": HNSW_SPACE,
+    "hnsw:M": HNSW_M,
+    "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+    "hnsw:search_ef": HNSW_SEARCH_EF,
+    "hnsw:num_threads": os.cpu_count() or 1
+}
+
+
+def _default_onnx_file() -> str:
+    """
+    Pick the quantized ONNX export whose int8 kernels suit this CPU
+    
+    Returns:
+        Path of the ONNX file within the model repository
+    """
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            flags = next(
+                (line.split(":", 1)[1].split() for line in cpuinfo if line.startswith("flags")),
+                []
+            )
+    except OSError:
+        flags = []
+    
+    if "avx512_vnni" in flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    if "avx512f" in flags:
+        return "onnx/model_qint8_avx512.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+
+@functools.lru_cache(maxsize=4)
+def _load_embedding_model(
+    model_name: str = EMBEDDING_MODEL,
+    backend: str = EMBEDDING_BACKEND
+) -> tuple[HuggingFaceEmbeddings, str]:
+    """
+    Load the sentence-transformers model, preferring the quantized ONNX export.
+    Cached, so every VectorStoreManager shares one loaded model
+    
+    Args:
+        model_name: Sentence-transformers model name
+        backend: Preferred inference backend, "onnx" or "torch"
+    
+    Returns:
+        Tuple of (embeddings model, backend actually used)
+    """
+    encode_kwargs = {
+        'normalize_embeddings': True,
+        'batch_size': EMBEDDING_BATCH_SIZE
+    }
+    
+    if backend == "onnx":
+        onnx_file = EMBEDDING_ONNX_FILE or _default_onnx_file()
+        try:
+            import onnxruntime as ort
+            # sentence-transformers reports a missing Optimum as a bare
+            # Exception, so check for it up front as an ImportError
+            import optimum.onnxruntime  # noqa: F401
+            
+            session_options = ort.SessionOptions()
+            session_options.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+            embeddings = HuggingFaceEmbeddings(
+                model_name=model_name,
+                model_kwargs={
+                    'device': 'cpu',
+                    'backend': 'onnx',
+                    'model_kwargs': {
+                        'file_name': onnx_file,
+                        'provider': 'CPUExecutionProvider',
+                        'session_options': session_options
+                    }
+                },
+                encode_kwargs=encode_kwargs
+            )
+            return embeddings, "onnx"
+        except ImportError as e:
+            logger.warning("ONNX backend unavailable (%s); embedding with PyTorch", e)
+        except OSError as e:
+            # The auto-selected export may be missing or not downloadable;
+            # an explicitly configured EMBEDDING_ONNX_FILE must load
+            if EMBEDDING_ONNX_FILE:
+                raise
+            logger.warning("Could not load %s (%s); embedding with PyTorch", onnx_file, e)
+    
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_name,
+        model_kwargs={'device': 'cpu'},
+        encode_kwargs=encode_kwargs
+    )
+    return embeddings, "torch"
 
 
 class VectorStoreManager:
@@ -19,11 +141,14 @@ class VectorStoreManager:
     
     def __init__(self):
         """Initialize the vector store with embeddings and ChromaDB client"""
-        # Initialize embeddings model
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=EMBEDDING_MODEL,
-            model_kwargs={'device': 'cpu'},
-            encode_kwargs={'normalize_embeddings': True}
+        # Initialize embeddings model, reusing cached vectors for known chunks;
+        # the backend is part of the cache key since outputs differ slightly
+        embeddings, backend = _load_embedding_model(EMBEDDING_MODEL, EMBEDDING_BACKEND)
+        # Backend actually in use, which may be torch if ONNX was unavailable
+        self.embedding_backend = backend
+        self.embeddings = CachedEmbeddings(
+            embeddings,
+            model_name=f"{EMBEDDING_MODEL}:{backend}"
         )
         
         # Create ChromaDB directory if it doesn't exist
@@ -38,6 +163,31 @@ class VectorStoreManager:
             )
         )
         
+        # Serializes writes; one manager may be shared by several sessions
+        self._lock = threading.RLock()
+        
+        # Sidebar listings, kept up to date by the write methods
+        self._sources_cache: Optional[set] = None
+        self._count_cache: Optional[int] = None
+        self._search_ef: Optional[int] = None
+        
+        # Incremented on every write, so caches derived from the shared store
+        # (e.g. each session's answer cache) can tell when they are stale
+        self._version = 0
+        
+        # Document-level metadata, one row per source
+        self._meta_conn = sqlite3.connect(DOCUMENTS_META_PATH, check_same_thread=False)
+        self._meta_conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents_meta ("
+            "source TEXT PRIMARY KEY, content_hash TEXT, "
+            "total_chunks INTEGER NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._meta_conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_documents_meta_hash "
+            "ON documents_meta (content_hash)"
+        )
+        self._meta_conn.commit()
+        
         # Initialize or get collection
         self.vector_store = None
         self._initialize_vector_store()
@@ -58,12 +208,17 @@ class VectorStoreManager:
             # Collection doesn't exist, will be created when first document is added
             self.vector_store = None
     
-    def add_documents(self, documents: List[Document]) -> bool:
+    def add_documents(
+        self, 
+        documents: List[Document],
+        documents_meta: Optional[List[Dict[str, Any]]] = None
+    ) -> bool:
         """
         Add documents to the vector store
         
         Args:
             documents: List of LangChain Document objects
+            documents_meta: Document-level metadata, one dict per source
             
         Returns:
             True if successful, False otherwise
@@ -72,24 +227,111 @@ class VectorStoreManager:
             if not documents:
                 return False
             
-            # Create or update vector store
-            if self.vector_store is None:
-                self.vector_store = Chroma.from_documents(
-                    documents=documents,
-                    embedding=self.embeddings,
-                    client=self.client,
-                    collection_name=COLLECTION_NAME,
-                    persist_directory=CHROMA_DB_PATH
-                )
-            else:
-                # Add documents to existing vector store
-                self.vector_store.add_documents(documents)
+            texts = [doc.page_content for doc in documents]
+            metadatas = [doc.metadata for doc in documents]
+            # Stable ids, so re-indexing a document overwrites its chunks
+            ids = [
+                f"{doc.metadata.get('source', 'unknown')}:{doc.metadata.get('chunk_index', idx)}"
+                for idx, doc in enumerate(documents)
+            ]
+            
+            # Embed everything in one call so the model runs full batches
+            # (outside the lock; this is the slow part)
+            vectors = self.embeddings.embed_documents(texts)
+            
+            with self._lock:
+                # Create vector store on first use
+                if self.vector_store is None:
+                    self.vector_store = Chroma(
+                        client=self.client,
+                        collection_name=COLLECTION_NAME,
+                        embedding_function=self.embeddings,
+                        collection_metadata=_COLLECTION_METADATA
+                    )
+                collection = self.client.get_collection(name=COLLECTION_NAME)
+                
+                # Drop chunks left over from an earlier version of the same files
+                sources = sorted({meta.get("source") for meta in metadatas if meta.get("source")})
+                if sources:
+                    collection.delete(where={"source": {"$in": sources}})
+                
+                # Insert precomputed vectors directly, within Chroma's batch limit
+                batch_size = self.client.get_max_batch_size()
+                for start in range(0, len(ids), batch_size):
+                    end = start + batch_size
+                    collection.upsert(
+                        ids=ids[start:end],
+                        embeddings=vectors[start:end],
+                        metadatas=metadatas[start:end],
+                        documents=texts[start:end]
+                    )
+                
+                if self._sources_cache is not None:
+                    self._sources_cache.update(sources)
+                # Replaced chunks make the new total unknown, so count again;
+                # the total also decides how exhaustively to search
+                self._count_cache = collection.count()
+                self._tune_search_ef(collection, self._count_cache)
+                self._version += 1
+                
+                if documents_meta:
+                    self._meta_conn.executemany(
+                        "INSERT OR REPLACE INTO documents_meta "
+                        "(source, content_hash, total_chunks, metadata) VALUES (?, ?, ?, ?)",
+                        [
+                            (
+                                meta["source"],
+                                meta.get("content_hash"),
+                                meta.get("total_chunks", 0),
+                                json.dumps(meta)
+                            )
+                            for meta in documents_meta
+                        ]
+                    )
+                    self._meta_conn.commit()
             
             return True
             
         except Exception as e:
             raise Exception(f"Error adding documents to vector store: {str(e)}")
     
+    def _tune_search_ef(self, collection, count: int):
+        """
+        Search small collections exhaustively and larger ones approximately
+        
+        Args:
+            collection: ChromaDB collection
+            count: Number of chunks in the collection
+        """
+        search_ef = count if count < HNSW_EXACT_SEARCH_MAX_CHUNKS else HNSW_SEARCH_EF
+        search_ef = max(search_ef, HNSW_SEARCH_EF)
+        if search_ef == self._search_ef:
+            return
+        
+        try:
+            collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+            self._search_ef = search_ef
+        except Exception:
+            # Collection configuration not supported; keep its ef_search
+            pass
+    
+    @property
+    def version(self) -> int:
+        """Number of writes (adds, deletes, clears) made to the store so far"""
+        return self._version
+    
+    def get_query_embedding(self, query: str) -> List[float]:
+        """
+        Embed a query string with the store's embedding model
+        
+        Args:
+            query: Query string
+            
+        Returns:
+            Normalized query embedding (cached for repeated queries)
+        """
+        return self.embeddings.embed_query(query)
+    
     def similarity_search(
         self, 
         query: str, 
@@ -111,17 +353,11 @@ class VectorStoreManager:
             return []
         
         try:
-            if filter_dict:
-                results = self.vector_store.similarity_search(
-                    query=query,
-                    k=k,
-                    filter=filter_dict
-                )
-            else:
-                results = self.vector_store.similarity_search(
-                    query=query,
-                    k=k
-                )
+            results = self.vector_store.similarity_search_by_vector(
+                self.get_query_embedding(query),
+                k=k,
+                filter=filter_dict or None
+            )
             return results
             
         except Exception as e:
@@ -146,8 +382,8 @@ class VectorStoreManager:
             return []
         
         try:
-            results = self.vector_store.similarity_search_with_score(
-                query=query,
+            results = self.vector_store.similarity_search_by_vector_with_relevance_scores(
+                self.get_query_embedding(query),
                 k=k
             )
             return results
@@ -166,24 +402,70 @@ class VectorStoreManager:
             return []
         
         try:
-            # Get the collection
-            collection = self.client.get_collection(name=COLLECTION_NAME)
-            
-            # Get all documents
-            results = collection.get()
-            
-            # Extract unique sources from metadata
-            sources = set()
-            if results and 'metadatas' in results:
-                for metadata in results['metadatas']:
-                    if metadata and 'source' in metadata:
-                        sources.add(metadata['source'])
-            
-            return sorted(list(sources))
+            with self._lock:
+                if self._sources_cache is None:
+                    # Get the collection
+                    collection = self.client.get_collection(name=COLLECTION_NAME)
+                    
+                    # Get metadata only; documents and embeddings are not needed
+                    results = collection.get(include=["metadatas"])
+                    
+                    # Extract unique sources from metadata
+                    sources = set()
+                    if results and 'metadatas' in results:
+                        for metadata in results['metadatas']:
+                            if metadata and 'source' in metadata:
+                                sources.add(metadata['source'])
+                    self._sources_cache = sources
+                
+                return sorted(self._sources_cache)
             
         except Exception as e:
             raise Exception(f"Error retrieving documents: {str(e)}")
     
+    def get_documents_meta(self, sources: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Get document-level metadata for the given sources
+        
+        Args:
+            sources: Document source names
+            
+        Returns:
+            Dictionary mapping each known source to its metadata
+        """
+        if not sources:
+            return {}
+        
+        unique_sources = list(set(sources))
+        placeholders = ",".join("?" * len(unique_sources))
+        with self._lock:
+            rows = self._meta_conn.execute(
+                f"SELECT source, metadata FROM documents_meta WHERE source IN ({placeholders})",
+                unique_sources
+            ).fetchall()
+        
+        return {source: json.loads(metadata) for source, metadata in rows}
+    
+    def has_hash(self, content_hash: str) -> bool:
+        """
+        Check whether a document with the given content hash is already indexed
+        
+        Args:
+            content_hash: SHA-256 hex digest of the document content
+            
+        Returns:
+            True if a stored document has this hash
+        """
+        if self.vector_store is None:
+            return False
+        
+        with self._lock:
+            row = self._meta_conn.execute(
+                "SELECT 1 FROM documents_meta WHERE content_hash = ? LIMIT 1",
+                (content_hash,)
+            ).fetchone()
+        return row is not None
+    
     def delete_document(self, source_name: str) -> bool:
         """
         Delete all chunks of a specific document from the vector store
@@ -198,20 +480,25 @@ class VectorStoreManager:
             return False
         
         try:
-            # Get the collection
-            collection = self.client.get_collection(name=COLLECTION_NAME)
-            
-            # Get all IDs for documents with this source
-            results = collection.get(
-                where={"source": source_name}
-            )
-            
-            if results and 'ids' in results and results['ids']:
-                # Delete all chunks with this source
-                collection.delete(ids=results['ids'])
-                return True
+            with self._lock:
+                # Get the collection
+                collection = self.client.get_collection(name=COLLECTION_NAME)
+                
+                # Delete all chunks with this source in one filtered call
+                collection.delete(where={"source": source_name})
+                
+                self._meta_conn.execute(
+                    "DELETE FROM documents_meta WHERE source = ?",
+                    (source_name,)
+                )
+                self._meta_conn.commit()
+                
+                if self._sources_cache is not None:
+                    self._sources_cache.discard(source_name)
+                self._count_cache = None
+                self._version += 1
             
-            return False
+            return True
             
         except Exception as e:
             raise Exception(f"Error deleting document: {str(e)}")
@@ -224,11 +511,18 @@ class VectorStoreManager:
             True if successful, False otherwise
         """
         try:
-            # Delete the collection
-            self.client.delete_collection(name=COLLECTION_NAME)
-            
-            # Reinitialize vector store
-            self.vector_store = None
+            with self._lock:
+                # Delete the collection and its document metadata
+                self.client.delete_collection(name=COLLECTION_NAME)
+                self._meta_conn.execute("DELETE FROM documents_meta")
+                self._meta_conn.commit()
+                
+                # Reinitialize vector store
+                self.vector_store = None
+                self._sources_cache = set()
+                self._count_cache = 0
+                self._search_ef = None
+                self._version += 1
             
             return True
             
@@ -246,8 +540,11 @@ class VectorStoreManager:
             return 0
         
         try:
-            collection = self.client.get_collection(name=COLLECTION_NAME)
-            return collection.count()
+            with self._lock:
+                if self._count_cache is None:
+                    collection = self.client.get_collection(name=COLLECTION_NAME)
+                    self._count_cache = collection.count()
+                return self._count_cache
             
         except Exception:
             return 0